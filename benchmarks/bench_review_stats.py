@@ -0,0 +1,78 @@
+"""Benchmarks review statistics on a synthetic collection.
+
+Builds a collection.anki2 with a large revlog and times convert_deck with
+and without review_stats. Run from the repository root:
+
+    python benchmarks/bench_review_stats.py --revlog-rows 5000000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mcp_server.anki_logic import convert_deck
+
+SCHEMA = """
+CREATE TABLE col (id integer primary key, ver integer not null);
+CREATE TABLE notes (id integer primary key, flds text not null);
+CREATE TABLE cards (id integer primary key, nid integer not null,
+                    factor integer not null, lapses integer not null);
+CREATE TABLE revlog (id integer primary key, cid integer not null, ease integer not null,
+                     ivl integer not null, factor integer not null, type integer not null);
+CREATE INDEX ix_cards_nid on cards (nid);
+CREATE INDEX ix_revlog_cid on revlog (cid);
+"""
+
+def build_collection(path, notes, cards_per_note, revlog_rows):
+    rnd = random.Random(0)
+    conn = sqlite3.connect(path)
+    conn.executescript("PRAGMA journal_mode=OFF; PRAGMA synchronous=OFF;" + SCHEMA)
+    conn.execute("INSERT INTO col VALUES (1, 11)")
+    base = 1_500_000_000_000
+    conn.executemany("INSERT INTO notes VALUES (?, ?)",
+                     ((base + i, f"Question {i}\x1fAnswer {i}") for i in range(notes)))
+    card_count = notes * cards_per_note
+    conn.executemany("INSERT INTO cards VALUES (?, ?, ?, ?)",
+                     ((base + i, base + i // cards_per_note, rnd.choice((0, 1300, 2500, 2800)), rnd.randint(0, 8))
+                      for i in range(card_count)))
+    conn.executemany("INSERT INTO revlog VALUES (?, ?, ?, ?, ?, ?)",
+                     ((base + i * 1000, base + rnd.randrange(card_count), rnd.randint(1, 4),
+                       rnd.randint(1, 300), 2500, rnd.randint(0, 3))
+                      for i in range(revlog_rows)))
+    conn.commit()
+    conn.close()
+
+def timed(label, func):
+    start = time.perf_counter()
+    result = func()
+    print(f"{label:<28} {time.perf_counter() - start:8.2f} s")
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--notes", type=int, default=200_000)
+    parser.add_argument("--cards-per-note", type=int, default=2)
+    parser.add_argument("--revlog-rows", type=int, default=5_000_000)
+    parser.add_argument("--chunk-size", type=int, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        input_dir = os.path.join(tmp, "deck")
+        os.makedirs(input_dir)
+        print(f"{args.notes} notes, {args.notes * args.cards_per_note} cards, {args.revlog_rows} revlog rows")
+        timed("build collection", lambda: build_collection(
+            os.path.join(input_dir, "collection.anki2"), args.notes, args.cards_per_note, args.revlog_rows))
+
+        timed("convert", lambda: convert_deck(
+            input_dir, os.path.join(tmp, "plain"), chunk_size=args.chunk_size))
+        log, _ = timed("convert --review-stats", lambda: convert_deck(
+            input_dir, os.path.join(tmp, "stats"), chunk_size=args.chunk_size, review_stats=True))
+        print("\n".join(log))
+
+if __name__ == "__main__":
+    main()
@@ -13,6 +13,103 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 OUTPUT_DIR = BASE_DIR
 IMAGES_DIR = os.path.join(OUTPUT_DIR, "Anki_Images")
 
+# Format detection, copied verbatim from mcp_server/formats.py so this script
+# keeps running on its own next to an extracted deck. Keep both in sync.
+# Header signatures of the members found inside an .apkg
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+SQLITE_MAGIC = b'SQLite format 3\x00'
+
+ZSTD = "zstd"
+JSON = "json"
+PROTOBUF = "protobuf"
+SQLITE = "sqlite"
+UNKNOWN = "unknown"
+
+# Enough bytes to recognise every format above
+HEADER_SIZE = 32
+
+# Collection members, newest first
+COLLECTION_NAMES = ("collection.anki21b", "collection.anki21", "collection.anki2")
+
+def sniff_bytes(head):
+    """Classifies a member from its first few bytes."""
+    if head.startswith(ZSTD_MAGIC):
+        return ZSTD
+    if head.startswith(SQLITE_MAGIC):
+        return SQLITE
+    stripped = head.lstrip(b' \t\r\n\xef\xbb\xbf')
+    if stripped[:1] in (b'{', b'['):
+        return JSON
+    # MediaEntries protobuf: field 1, wire type 2 (length-delimited)
+    if head[:1] == b'\x0a':
+        return PROTOBUF
+    return UNKNOWN
+
+def read_header(path, size=HEADER_SIZE):
+    """Reads the first bytes of a file."""
+    with open(path, "rb") as f:
+        return f.read(size)
+
+def read_zstd_header(path, size=HEADER_SIZE):
+    """Decompresses just enough of a zstd file to classify its payload."""
+    with open(path, "rb") as f:
+        with zstandard.ZstdDecompressor().stream_reader(f) as reader:
+            return reader.read(size)
+
+def zstd_frame_complete(path):
+    """True if the zstd file holds at least one complete frame.
+
+    A truncated file decompresses to nothing without raising, which is
+    otherwise indistinguishable from an empty payload.
+    """
+    dobj = zstandard.ZstdDecompressor().decompressobj()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            dobj.decompress(block)
+            if dobj.eof:
+                return True
+    return False
+
+def sniff(path):
+    """Returns (container, payload) formats of a file.
+
+    container is ZSTD when the file is compressed, payload is the format of
+    the (decompressed) content.
+    """
+    head = read_header(path)
+    fmt = sniff_bytes(head)
+    if fmt != ZSTD:
+        return None, fmt
+    head = read_zstd_header(path)
+    if not head:
+        # An empty MediaEntries message compresses to a complete but empty
+        # frame; a truncated file is unusable.
+        return ZSTD, PROTOBUF if zstd_frame_complete(path) else UNKNOWN
+    return ZSTD, sniff_bytes(head)
+
+def read_member(path, container):
+    """Reads a whole member, decompressing it when needed."""
+    with open(path, "rb") as f:
+        if container == ZSTD:
+            with zstandard.ZstdDecompressor().stream_reader(f) as reader:
+                return reader.read()
+        return f.read()
+
+def find_collection(base_dir):
+    """Finds the newest collection member in base_dir.
+
+    Returns (path, container) or (None, None). Members whose payload is not
+    SQLite are skipped.
+    """
+    for name in COLLECTION_NAMES:
+        path = os.path.join(base_dir, name)
+        if not os.path.exists(path):
+            continue
+        container, payload = sniff(path)
+        if payload == SQLITE:
+            return path, container
+    return None, None
+
 # Ensure images directory exists
 os.makedirs(IMAGES_DIR, exist_ok=True)
 
@@ -28,38 +125,24 @@ media_map = {} # Key -> Sanitized Filename
 
 if os.path.exists(media_file):
     try:
-        data = b""
-        with open(media_file, "rb") as f:
-            dctx = zstandard.ZstdDecompressor()
-            with dctx.stream_reader(f) as reader:
-                data = reader.read()
-        
-        # Robust Backward-Scan Parsing
-        # 1. Find all common image extensions
-        # 2. Backtrack to find length byte and start of filename
-        # 3. Backtrack further to find potential Keys (Strings that match files on disk)
-         
+        # Classify by header bytes instead of trial decoding
+        container, payload = sniff(media_file)
+        data = read_member(media_file, container)
+
         # Make a set of existing files for quick lookup
         existing_files = set(os.listdir(BASE_DIR))
-        
-        existing_files = set(os.listdir(BASE_DIR))
-        
-        # Method 1: Try JSON (Direct or ZSTD decompressed)
+
+        # Method 1: JSON (Direct or ZSTD decompressed)
         # Some media files are just plain JSON
-        try:
-            # Try plain text first
-            try:
-                media_map = json.loads(data.decode("utf-8"))
-                print(f"Loaded {len(media_map)} media files via JSON.")
-            except:
-                # If decode failed or not JSON, it might be Protobuf
-                raise ValueError("Not JSON")
-        except:
+        if payload == JSON:
+            media_map = json.loads(data.decode("utf-8-sig"))
+            print(f"Loaded {len(media_map)} media files via JSON.")
+        elif payload == PROTOBUF:
              # Method 2: Protobuf List (ZSTD already decompressed into 'data')
              # Structure: Repeated [ Tag 1 (0a) | Len (Varint) | Content ]
              # Content: [ Tag 1 (0a) | Len (Varint) | Filename ] ...
              
-             print("JSON parse failed. Trying Protobuf List parsing...")
+             print("Media file is not JSON. Parsing Protobuf List...")
              i = 0
              n = len(data)
              idx = 0
@@ -116,6 +199,8 @@ if os.path.exists(media_file):
                 i = end_pos
              
              print(f"Loaded {len(media_map)} media files via Protobuf.")
+        else:
+            print("Media file is empty, truncated or in an unknown format; no media copied.")
 
         # Process the map
         for key, clean_name in media_map.items():
@@ -135,7 +220,7 @@ if os.path.exists(media_file):
                 is_zstd = False
                 try:
                     with open(src, "rb") as f_chk:
-                        if f_chk.read(4) == b'\x28\xb5\x2f\xfd': is_zstd = True
+                        if f_chk.read(4) == ZSTD_MAGIC: is_zstd = True
                 except: pass
                 
                 temp_dst = dst + ".tmp"
@@ -171,23 +256,28 @@ if os.path.exists(media_file):
     
 
 # 2. Extract Cards from DB
-# Check for v2 database
-db_path_v1 = os.path.join(BASE_DIR, "collection.anki2")
-db_path_v2_compressed = os.path.join(BASE_DIR, "collection.anki21b")
-db_path_real = db_path_v1
-
-if os.path.exists(db_path_v2_compressed):
-    print("Found v2 compressed database. Decompressing...")
-    db_path_v2_out = os.path.join(BASE_DIR, "collection.anki2_extracted")
-    if not os.path.exists(db_path_v2_out):
-        try:
-            with open(db_path_v2_compressed, "rb") as f_in, open(db_path_v2_out, "wb") as f_out:
-                dctx = zstandard.ZstdDecompressor()
-                dctx.copy_stream(f_in, f_out)
-            print("Decompression successful.")
-        except Exception as e:
-            print(f"Failed to decompress v2 DB: {e}. Falling back to v1.")
-    db_path_real = db_path_v2_out
+# Newest collection first (anki21b > anki21 > anki2), checked by header, so
+# the "update Anki" stub in newer exports is only used if nothing else is there
+try:
+    db_path_real, db_container = find_collection(BASE_DIR)
+except zstandard.ZstdError as e:
+    raise SystemExit(f"Failed to read collection: {e}")
+if db_path_real is None:
+    raise SystemExit("No collection.anki2, collection.anki21 or collection.anki21b found.")
+print(f"Using {os.path.basename(db_path_real)}.")
+
+if db_container == ZSTD:
+    print("Found compressed database. Decompressing...")
+    db_path_out = os.path.join(BASE_DIR, "collection.anki2_extracted")
+    try:
+        with open(db_path_real, "rb") as f_in, open(db_path_out + ".tmp", "wb") as f_out:
+            dctx = zstandard.ZstdDecompressor()
+            dctx.copy_stream(f_in, f_out)
+        os.replace(db_path_out + ".tmp", db_path_out)
+        print("Decompression successful.")
+    except Exception as e:
+        raise SystemExit(f"Failed to decompress {os.path.basename(db_path_real)}: {e}")
+    db_path_real = db_path_out
 
 conn = sqlite3.connect(db_path_real)
 cursor = conn.cursor()
@@ -1,214 +1,494 @@
+import binascii
+import hashlib
+import io
 import os
 import sqlite3
 import json
-import shutil
 import re
+import shutil
+import zipfile
+from datetime import datetime, timezone
 import zstandard
-from urllib.parse import quote
+from . import formats, shards
+from .checkpoint import Checkpoint, hash_input
+from .sinks import ARCHIVE_FORMATS, open_sink
 
 def sanitize_filename(name):
     """Sanitizes filenames to be safe for disk/markdown."""
     name = name.replace(" ", "_")
     return re.sub(r'[^a-zA-Z0-9_.-]', '', name)
 
-def fix_image_paths(text):
-    """Converts Anki <img src> to Markdown ![image] with sanitized paths."""
+IMG_SRC_RE = re.compile(r'<img src="([^"]+)">')
+
+# Any <img> tag with an inline data URI, whatever its other attributes
+DATA_IMG_RE = re.compile(r'<img\b[^>]*?\ssrc=(["\'])(data:[^"\']*)\1[^>]*>', re.IGNORECASE)
+
+# data:image/<type>[;param=value]...;base64,<payload>
+DATA_URI_RE = re.compile(r'data:image/([a-zA-Z0-9.+-]+)(?:;[^;,=]+=[^;,]*)*;base64,')
+
+DATA_URI_EXTENSIONS = {"jpeg": ".jpg", "svg+xml": ".svg", "x-icon": ".ico"}
+
+# Encoded characters decoded per step; a multiple of 4 keeps base64 aligned
+DATA_URI_STEP = 1 << 18
+
+# Replaces inline images that cannot be decoded, instead of their payload
+DATA_URI_PLACEHOLDER = "*[inline image omitted]*"
+
+_NON_BASE64_RE = re.compile(r'[^A-Za-z0-9+/=]+')
+
+def _iter_base64(payload):
+    """Decodes base64 text slice by slice, yielding the decoded bytes.
+
+    Characters outside the alphabet (line breaks in wrapped payloads) are
+    dropped per slice, and leftovers are carried over so every decoded
+    slice stays 4-aligned.
+    """
+    carry = ""
+    for i in range(0, len(payload), DATA_URI_STEP):
+        piece = payload[i:i + DATA_URI_STEP]
+        if _NON_BASE64_RE.search(piece):
+            piece = _NON_BASE64_RE.sub("", piece)
+        piece = carry + piece
+        cut = len(piece) - len(piece) % 4
+        carry = piece[cut:]
+        if cut:
+            yield binascii.a2b_base64(piece[:cut])
+    if carry:
+        # Unpadded payloads are common; restore the padding they left out
+        yield binascii.a2b_base64(carry + "=" * (-len(carry) % 4))
+
+class _IterReader(io.RawIOBase):
+    """Readable file object over an iterator of byte strings."""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buf = memoryview(b"")
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._buf:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return 0
+            self._buf = memoryview(chunk)
+        n = min(len(b), len(self._buf))
+        b[:n] = self._buf[:n]
+        self._buf = self._buf[n:]
+        return n
+
+def save_data_uri(src, sink):
+    """Decodes a base64 data URI image into sink under a content-hash name.
+
+    Identical images map to the same file, so each is written only once
+    per deck. Returns the file name, or None if src cannot be decoded.
+    """
+    match = DATA_URI_RE.match(src)
+    if not match:
+        return None
+    subtype = match.group(1).lower()
+    ext = DATA_URI_EXTENSIONS.get(subtype, "." + sanitize_filename(subtype))
+    payload = src[match.end():]
+
+    # First pass: hash and measure without keeping the decoded bytes
+    h = hashlib.sha256()
+    size = 0
+    try:
+        for part in _iter_base64(payload):
+            h.update(part)
+            size += len(part)
+    except binascii.Error:
+        return None
+    if not size:
+        return None
+
+    # Second pass: decode again straight into the sink
+    name = f"inline_{h.hexdigest()[:32]}{ext}"
+    if not sink.exists(f"Anki_Images/{name}"):
+        sink.write_stream(f"Anki_Images/{name}",
+                          lambda: io.BufferedReader(_IterReader(_iter_base64(payload))), size)
+    return name
+
+def fix_image_paths(text, sink=None):
+    """Converts Anki <img src> to Markdown ![image] with sanitized paths.
+
+    With a sink, inline data URI images are extracted into Anki_Images/;
+    data URIs that cannot be extracted become a short placeholder.
+    """
+    def repl_data(match):
+        name = save_data_uri(match.group(2), sink) if sink is not None else None
+        if name is None:
+            return DATA_URI_PLACEHOLDER
+        return f'![image](Anki_Images/{name})'
+
     def repl(match):
-        src = match.group(1)
-        clean_src = sanitize_filename(src)
+        clean_src = sanitize_filename(match.group(1))
         return f'![image](Anki_Images/{clean_src})'
-    return re.sub(r'<img src="([^"]+)">', repl, text)
+    return IMG_SRC_RE.sub(repl, DATA_IMG_RE.sub(repl_data, text))
+
+def referenced_media(fields):
+    """Returns the sanitized media names referenced by rendered fields."""
+    return {sanitize_filename(src) for field in fields[:2] for src in IMG_SRC_RE.findall(field)
+            if not src.startswith("data:")}
+
+def parse_media_protobuf(data):
+    """Parses a MediaEntries protobuf into {index: sanitized filename}.
+
+    Structure: Repeated [ Tag 1 (0a) | Len (Varint) | Content ]
+    Content: [ Tag 1 (0a) | Len (Varint) | Filename ] ...
+    The files on disk are named after the entry index.
+    """
+    media_map = {}
+    i = 0
+    n = len(data)
+    idx = 0
+
+    def read_varint(i):
+        shift = 0
+        value = 0
+        while i < n:
+            b = data[i]
+            i += 1
+            value |= (b & 0x7F) << shift
+            if not (b & 0x80): break
+            shift += 7
+        return value, i
+
+    while i < n:
+        if data[i] != 0x0a:
+            i += 1
+            continue
+        outer_len, i = read_varint(i + 1)
+        if i >= n: break
+        end_pos = i + outer_len
+
+        if data[i] == 0x0a:
+            inner_len, i = read_varint(i + 1)
+            if i + inner_len <= n:
+                try:
+                    filename = data[i:i + inner_len].decode("utf-8")
+                    media_map[str(idx)] = sanitize_filename(filename)
+                except UnicodeDecodeError: pass
+            idx += 1
+
+        i = end_pos
+    return media_map
+
+def load_media_map(media_file):
+    """Reads the 'media' member, dispatching on its detected format."""
+    container, payload = formats.sniff(media_file)
+    data = formats.read_member(media_file, container)
+    label = "ZSTD " if container == formats.ZSTD else ""
+
+    if payload == formats.JSON:
+        raw = json.loads(data.decode("utf-8-sig"))
+        media_map = {key: sanitize_filename(name) for key, name in raw.items()}
+        return media_map, f"Loaded {len(media_map)} from {label}JSON."
+    if payload == formats.PROTOBUF:
+        media_map = parse_media_protobuf(data)
+        return media_map, f"Loaded {len(media_map)} from {label}Protobuf."
+    return {}, "Error: Media file is empty, truncated or in an unknown format; no media copied."
+
+def _reencode_image(data, fmt):
+    """Validates and re-saves a PNG/JPEG body with Pillow."""
+    try:
+        from PIL import Image
+        with Image.open(io.BytesIO(data)) as img:
+            img.load()
+            if fmt == "JPEG" and img.mode in ("RGBA", "P"): img = img.convert("RGB")
+            out = io.BytesIO()
+            img.save(out, format=fmt)
+            return out.getvalue()
+    except Exception:
+        return data
+
+def _open_zstd(src):
+    return zstandard.ZstdDecompressor().stream_reader(open(src, "rb"), read_across_frames=True, closefd=True)
+
+def write_media_file(src, clean_name, sink):
+    """Copies one media file into sink, decompressing it if needed.
+
+    PNG/JPEG bodies are re-encoded by Pillow and therefore read into memory;
+    everything else (audio, video, other images) is streamed.
+    """
+    name = f"Anki_Images/{clean_name}"
+    compressed = formats.sniff_bytes(formats.read_header(src, 4)) == formats.ZSTD
+
+    # Pillow
+    fmt = None
+    if clean_name.lower().endswith(".png"): fmt = "PNG"
+    elif clean_name.lower().endswith((".jpg", ".jpeg")): fmt = "JPEG"
+    if fmt:
+        try:
+            data = formats.read_member(src, formats.ZSTD if compressed else None)
+        except zstandard.ZstdError:
+            data = formats.read_member(src, None)
+        sink.write(name, _reencode_image(data, fmt))
+        return
 
-def extract_media(base_dir, images_dir):
-    """Extracts media from the Anki 'media' file."""
+    if compressed:
+        try:
+            sink.write_stream(name, lambda: _open_zstd(src))
+            return
+        except zstandard.ZstdError:
+            pass
+    sink.write_stream(name, lambda: open(src, "rb"), os.path.getsize(src))
+
+def extract_media(base_dir, sink, checkpoint=None, wanted=None):
+    """Extracts media from the Anki 'media' file into sink.
+
+    Entries already recorded in checkpoint are skipped, as are entries
+    whose sanitized name the optional wanted(name) predicate rejects.
+    """
     media_file = os.path.join(base_dir, "media")
-    media_map = {} # Key -> Sanitized Filename
 
     if not os.path.exists(media_file):
-        return media_map, "No media file found."
+        return {}, "No media file found."
 
     try:
-        data = None
-        # Try pure json load first (standard v2)
-        try:
-            with open(media_file, "r", encoding="utf-8") as f:
-                media_map = json.load(f)
-            # Check if keys exist
-            return media_map, f"Loaded {len(media_map)} from JSON."
-        except: pass
-
-        # Binary/Compressed handling
-        with open(media_file, "rb") as f:
-            dctx = zstandard.ZstdDecompressor()
-            with dctx.stream_reader(f) as reader:
-                data = reader.read()
-        
-        # Manual scan for \n KEY \n LEN FILENAME
-        i = 0
-        n = len(data)
-        
-        existing_files = set(os.listdir(base_dir))
-        
-        # Shift-Map for Windows/US keyboards (heuristic)
-        # ! -> 1, " -> 2, etc.
-        shift_map = {
-            '!': '1', '"': '2', '§': '3', '$': '4', '%': '5', '&': '6', '/': '7', '(': '8', ')': '9', '=': '0',
-            '+': '*',  # + might map to *? Or vice/versa. 
-            # In Anki sometimes keys are just indices.
-            # If we see symbol keys, we check for digit files.
-        }
-        
-        while i < n - 5:
-            if data[i] == 10: # \n
-                j = i + 1
-                while j < n and j < i + 50 and data[j] != 10:
-                    j += 1
-                
-                if j < n and data[j] == 10:
-                    key_bytes = data[i+1:j]
-                    try:
-                        key = key_bytes.decode('utf-8')
-                        
-                        # LEN
-                        if j + 1 < n:
-                            length = data[j+1]
-                            start_fn = j + 2
-                            end_fn = start_fn + length
-                            
-                            if end_fn <= n:
-                                fn_bytes = data[start_fn:end_fn]
-                                filename = fn_bytes.decode('utf-8')
-                                
-                                if "." in filename:
-                                    clean_name = sanitize_filename(filename)
-                                    media_map[key] = clean_name
-                                    
-                                    # Copy logic
-                                    # Try Key
-                                    src_key = key
-                                    if src_key not in existing_files:
-                                        # Try Fallback
-                                        if key in shift_map and shift_map[key] in existing_files:
-                                            src_key = shift_map[key]
-                                        # Try ASCII code? e.g. " -> 34
-                                        elif len(key) == 1 and str(ord(key[0])) in existing_files:
-                                            src_key = str(ord(key[0]))
-                                    
-                                    src = os.path.join(base_dir, src_key)
-                                    dst = os.path.join(images_dir, clean_name)
-                                    
-                                    if os.path.exists(src):
-                                        # Decompress/Fix
-                                        is_zstd = False
-                                        try:
-                                            with open(src, "rb") as f_chk:
-                                                if f_chk.read(4) == b'\x28\xb5\x2f\xfd': is_zstd = True
-                                        except: pass
-                                        
-                                        temp_dst = dst + ".tmp"
-                                        if is_zstd:
-                                            try:
-                                                with open(src, "rb") as f_in, open(temp_dst, "wb") as f_out:
-                                                    zstandard.ZstdDecompressor().copy_stream(f_in, f_out)
-                                            except: shutil.copy2(src, temp_dst)
-                                        else:
-                                            shutil.copy2(src, temp_dst)
-                                        
-                                        # Pillow
-                                        valid_img = False
-                                        try:
-                                            from PIL import Image
-                                            with Image.open(temp_dst) as img:
-                                                img.load()
-                                                valid_img = True
-                                                fmt = None
-                                                if clean_name.lower().endswith(".png"): fmt = "PNG"
-                                                elif clean_name.lower().endswith((".jpg", ".jpeg")): fmt = "JPEG"
-                                                if fmt:
-                                                    if fmt == "JPEG" and img.mode in ("RGBA", "P"): img = img.convert("RGB")
-                                                    img.save(dst, format=fmt)
-                                                else: shutil.move(temp_dst, dst)
-                                                if os.path.exists(temp_dst): os.remove(temp_dst)
-                                        except:
-                                            if os.path.exists(temp_dst): shutil.move(temp_dst, dst)
-                                            
-                                        # found = True # This variable was not used, removed.
-                    except: pass
-            i += 1
-            
-        return media_map, f"Extracted {len(media_map)} images using manual scan."
+        media_map, msg = load_media_map(media_file)
+        skipped = 0
+        for key, clean_name in media_map.items():
+            if checkpoint is not None and key in checkpoint.media:
+                skipped += 1
+                continue
+            if wanted is not None and not wanted(clean_name):
+                continue
+            src = os.path.join(base_dir, key)
+            if os.path.exists(src):
+                write_media_file(src, clean_name, sink)
+            if checkpoint is not None:
+                checkpoint.mark_media(key)
+        if skipped:
+            msg += f" Skipped {skipped} already copied."
+        return media_map, msg
     except Exception as e:
-        return media_map, f"Error extracting media: {str(e)}"
+        return {}, f"Error extracting media: {str(e)}"
+
+NOTES_QUERY = "SELECT flds FROM notes ORDER BY id"
+
+# Per-note review statistics in one pass: revlog is aggregated per card
+# (served by the ix_revlog_cid index), cards per note, and the result is
+# joined to the notes so it streams in the same cursor.
+NOTES_WITH_STATS_QUERY = """
+SELECT n.flds, s.reviews, s.lapses, s.ease, s.last_review
+FROM notes n
+LEFT JOIN (
+    SELECT c.nid AS nid,
+           SUM(r.reviews) AS reviews,
+           SUM(c.lapses) AS lapses,
+           AVG(NULLIF(c.factor, 0)) AS ease,
+           MAX(r.last_review) AS last_review
+    FROM cards c
+    LEFT JOIN (
+        SELECT cid, COUNT(*) AS reviews, MAX(id) AS last_review
+        FROM revlog
+        GROUP BY cid
+    ) r ON r.cid = c.id
+    GROUP BY c.nid
+) s ON s.nid = n.id
+ORDER BY n.id
+"""
+
+def format_review_stats(reviews, lapses, ease, last_review):
+    """Renders one note's review statistics as a Markdown quote line."""
+    if not reviews:
+        return "> 📊 Not reviewed yet"
+    parts = [f"Reviews: {reviews}", f"Lapses: {lapses or 0}"]
+    if ease:
+        # Anki stores the ease factor in permille
+        parts.append(f"Ease: {round(ease / 10)}%")
+    if last_review:
+        # revlog ids are millisecond timestamps of the review
+        day = datetime.fromtimestamp(last_review / 1000, timezone.utc).date()
+        parts.append(f"Last review: {day.isoformat()}")
+    return "> 📊 " + " · ".join(parts)
+
+def convert_deck(input_dir, output_dir, chunk_size=50, resume=False, archive=None,
+                 review_stats=False, shard=None):
+    """Main function to convert Anki deck in input_dir to MD in output_dir.
+
+    Progress is journaled in output_dir; with resume=True a previous,
+    interrupted run on the same input is continued. With archive="zip" or
+    "tar" all parts and images are streamed into a single
+    Anki_Export.zip/.tar instead; such runs cannot be resumed.
+    review_stats=True adds review count, lapses, ease and last review date
+    below each question.
+
+    shard=(i, N) converts only the parts and media owned by shard i of N;
+    merge_shards() combines the N outputs into a single-node layout.
+
+    Returns (log, ok); ok is False if the conversion did not complete.
+    """
+    if archive is not None and archive not in ARCHIVE_FORMATS:
+        return [f"Error: Unknown archive format '{archive}'. Use one of: {', '.join(ARCHIVE_FORMATS)}."], False
+    if archive is not None and resume:
+        return ["Error: Resume is not supported for archive output."], False
+    if archive is not None and shard is not None:
+        return ["Error: Sharded runs write to a directory; archive output is not supported."], False
+
+    log = []
+
+    ckpt = None
+    if archive is None:
+        # Fingerprinting sniffs the collection, which fails on corrupt zstd
+        try:
+            input_hash = hash_input(input_dir)
+        except Exception as e:
+            return [f"Failed to open collection: {e}"], False
+        os.makedirs(output_dir, exist_ok=True)
+        settings = {"chunk_size": chunk_size, "review_stats": review_stats,
+                    "shard": list(shard) if shard else None}
+        ckpt, msg = Checkpoint.start(output_dir, input_hash, settings, resume=resume)
+        if ckpt is None:
+            return [msg], False
+        if resume:
+            log.append(msg)
+
+    sink = open_sink(output_dir, archive)
+    ok = False
+    try:
+        steps, ok = _convert(input_dir, sink, chunk_size, ckpt, review_stats, shard)
+    finally:
+        if ok:
+            sink.close()
+        else:
+            sink.abort()
+        if ckpt is not None:
+            ckpt.close()
+    if ok and ckpt is not None:
+        ckpt.finish()
+    if ok and archive is not None:
+        steps.append(f"Wrote {os.path.basename(sink.location)}.")
+    return log + steps, ok
+
+def default_output_dir(apkg_path):
+    """Returns <deck>_extracted next to the .apkg."""
+    base_name = os.path.splitext(os.path.basename(apkg_path))[0]
+    return os.path.join(os.path.dirname(apkg_path), f"{base_name}_extracted")
 
-def convert_deck(input_dir, output_dir, chunk_size=50):
-    """Main function to convert Anki deck in input_dir to MD in output_dir."""
+def convert_apkg(apkg_path, output_dir=None, **options):
+    """Extracts an .apkg into a temporary folder and runs convert_deck on it.
+
+    Returns (log, output_dir, ok); output_dir is None if nothing was
+    converted.
+    """
+    if not os.path.exists(apkg_path):
+        return [f"Error: File not found at {apkg_path}"], None, False
+    if not zipfile.is_zipfile(apkg_path):
+        return ["Error: Invalid .apkg file (not a valid zip)."], None, False
+
+    # Determine output directory
+    if output_dir is None:
+        output_dir = default_output_dir(apkg_path)
+    
+    os.makedirs(output_dir, exist_ok=True)
     
-    images_dir = os.path.join(output_dir, "Anki_Images")
-    os.makedirs(images_dir, exist_ok=True)
+    # Extract .apkg (it is a zip). A hard-killed earlier run may have left
+    # members of another deck behind, so always start from an empty folder.
+    extract_temp = os.path.join(output_dir, "temp_extract")
+    shutil.rmtree(extract_temp, ignore_errors=True)
+    os.makedirs(extract_temp)
+    
+    try:
+        try:
+            with zipfile.ZipFile(apkg_path, 'r') as zip_ref:
+                zip_ref.extractall(extract_temp)
+        except zipfile.BadZipFile:
+            return ["Error: Invalid .apkg file (not a valid zip)."], None, False
+
+        # Run conversion
+        results, ok = convert_deck(extract_temp, output_dir, **options)
+        return results, output_dir, ok
+    finally:
+        # Cleanup temp
+        shutil.rmtree(extract_temp, ignore_errors=True)
+
+def _render_part(idx, chunk, sink, review_stats):
+    md_content = f"# Anki Export Part {idx}\n\n"
     
+    for q_idx, note in enumerate(chunk, 1):
+        fields = note[0].split('\x1f')
+        if len(fields) >= 2:
+            front = fix_image_paths(fields[0], sink)
+            back = fix_image_paths(fields[1], sink)
+        else:
+            front = fix_image_paths(fields[0], sink)
+            back = "*No Back*"
+            
+        md_content += f"## Question {q_idx}\n\n"
+        md_content += f"{front}\n\n"
+        if review_stats:
+            md_content += format_review_stats(*note[1:]) + "\n\n"
+        md_content += f"<details><summary>🔽 Show Answer</summary>\n\n"
+        md_content += f"{back}\n\n"
+        md_content += f"</details>\n\n---\n\n"
+    return md_content
+
+def _convert(input_dir, sink, chunk_size, ckpt, review_stats, shard):
     log = []
 
-    # 1. Extract Media
-    media_map, msg = extract_media(input_dir, images_dir)
-    log.append(msg)
+    # 1. Extract Media (sharded runs need the note references first)
+    if shard is None:
+        media_map, msg = extract_media(input_dir, sink, checkpoint=ckpt)
+        log.append(msg)
 
     # 2. Extract database
-    db_path_v1 = os.path.join(input_dir, "collection.anki2")
-    db_path_v2_compressed = os.path.join(input_dir, "collection.anki21b")
-    db_path_real = db_path_v1
-
-    if os.path.exists(db_path_v2_compressed):
-        db_path_v2_out = os.path.join(input_dir, "collection.anki2_extracted")
-        if not os.path.exists(db_path_v2_out):
-            try:
-                with open(db_path_v2_compressed, "rb") as f_in, open(db_path_v2_out, "wb") as f_out:
-                    dctx = zstandard.ZstdDecompressor()
-                    dctx.copy_stream(f_in, f_out)
-                log.append("Decompressed v2 database.")
-            except Exception as e:
-                log.append(f"Failed to decompress v2 DB: {e}")
-        db_path_real = db_path_v2_out
-    
-    if not os.path.exists(db_path_real):
-        return ["Error: No collection.anki2 or collection.anki21b found."]
+    try:
+        db_path_real, schema, msg = formats.open_collection(input_dir)
+    except Exception as e:
+        return log + [f"Failed to open collection: {e}"], False
+    if db_path_real is None:
+        return log + [msg], False
+    log.append(msg)
 
     try:
         conn = sqlite3.connect(db_path_real)
         cursor = conn.cursor()
-        cursor.execute("SELECT flds FROM notes")
-        notes = cursor.fetchall()
-        log.append(f"Found {len(notes)} notes.")
-        
-        chunks = [notes[i:i + chunk_size] for i in range(0, len(notes), chunk_size)]
+        note_count = cursor.execute("SELECT COUNT(*) FROM notes").fetchone()[0]
+        log.append(f"Found {note_count} notes.")
+
+        # Stream notes chunk by chunk instead of loading the whole table
+        cursor.execute(NOTES_WITH_STATS_QUERY if review_stats else NOTES_QUERY)
+        chunks = iter(lambda: cursor.fetchmany(chunk_size), [])
         created_files = []
+        resumed = 0
+        own_refs = set()
+        all_refs = set()
 
         for idx, chunk in enumerate(chunks, 1):
             filename = f"Anki_Part_{idx}.md"
-            filepath = os.path.join(output_dir, filename)
-            
-            md_content = f"# Anki Export Part {idx}\n\n"
-            
-            for q_idx, note in enumerate(chunk, 1):
-                fields = note[0].split('\x1f')
-                if len(fields) >= 2:
-                    front = fix_image_paths(fields[0])
-                    back = fix_image_paths(fields[1])
-                else:
-                    front = fix_image_paths(fields[0])
-                    back = "*No Back*"
-                    
-                md_content += f"## Question {q_idx}\n\n"
-                md_content += f"{front}\n\n"
-                md_content += f"<details><summary>🔽 Show Answer</summary>\n\n"
-                md_content += f"{back}\n\n"
-                md_content += f"</details>\n\n---\n\n"
-                
-            with open(filepath, "w", encoding="utf-8") as f:
-                f.write(md_content)
+            if shard is not None:
+                refs = set().union(*(referenced_media(note[0].split('\x1f')) for note in chunk))
+                all_refs |= refs
+                if not shards.owns_part(idx, shard):
+                    continue
+                own_refs |= refs
+            if ckpt is not None and idx in ckpt.chunks and sink.exists(filename):
+                created_files.append(filename)
+                resumed += 1
+                continue
+
+            sink.write(filename, _render_part(idx, chunk, sink, review_stats).encode("utf-8"))
+            if ckpt is not None:
+                ckpt.mark_chunk(idx)
             created_files.append(filename)
             
         conn.close()
-        log.append(f"Created {len(created_files)} MD files.")
-        return log
+        if resumed:
+            log.append(f"Created {len(created_files)} MD files ({resumed} from checkpoint).")
+        else:
+            log.append(f"Created {len(created_files)} MD files.")
     except Exception as e:
-        return log + [f"Database error: {str(e)}"]
+        return log + [f"Database error: {str(e)}"], False
+
+    if shard is not None:
+        media_map, msg = extract_media(input_dir, sink, checkpoint=ckpt,
+                                       wanted=lambda name: shards.owns_media(name, own_refs, all_refs, shard))
+        log.append(msg)
+        total_parts = -(-note_count // chunk_size)
+        parts = [p for p in range(1, total_parts + 1) if shards.owns_part(p, shard)]
+        shards.write_manifest(sink, shard, ckpt.input_hash, ckpt.settings, parts, total_parts)
+        log.append(f"Shard {shard[0]}/{shard[1]}: {len(parts)} of {total_parts} parts.")
+    return log, True
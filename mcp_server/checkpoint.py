@@ -0,0 +1,120 @@
+import hashlib
+import json
+import os
+from . import formats
+
+CHECKPOINT_NAME = ".anki_checkpoint.jsonl"
+
+def _update_from_file(h, path):
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+
+def hash_file(path):
+    """Returns the SHA-256 of a file, read in 1 MiB blocks."""
+    h = hashlib.sha256()
+    _update_from_file(h, path)
+    return h.hexdigest()
+
+def hash_input(base_dir):
+    """Fingerprints an extracted deck.
+
+    Hashes the collection and the media map, plus the name and size of every
+    other member, so media blobs do not have to be read in full.
+    """
+    h = hashlib.sha256()
+    collection, _ = formats.find_collection(base_dir)
+    for path in (collection, os.path.join(base_dir, "media")):
+        if path is None or not os.path.exists(path):
+            continue
+        h.update(os.path.basename(path).encode("utf-8") + b"\0")
+        _update_from_file(h, path)
+    for name in sorted(os.listdir(base_dir)):
+        path = os.path.join(base_dir, name)
+        if name not in formats.EXTRACTED_FILES and os.path.isfile(path):
+            h.update(f"{name}\0{os.path.getsize(path)}\0".encode("utf-8"))
+    return h.hexdigest()
+
+class Checkpoint:
+    """Append-only journal of finished media entries and Markdown parts.
+
+    The first line records the input hash and the settings that shape the
+    output (chunk size, options), every following line one completed unit
+    of work. Lines are flushed as they are written, so a killed process
+    loses at most the unit it was working on.
+    """
+
+    def __init__(self, path, input_hash, settings):
+        self.path = path
+        self.input_hash = input_hash
+        self.settings = settings
+        self.media = set()
+        self.chunks = set()
+        self._file = None
+        self._complete = True
+
+    @classmethod
+    def start(cls, output_dir, input_hash, settings, resume=False):
+        """Opens the journal in output_dir.
+
+        settings is a JSON-serialisable dict. Returns (checkpoint, message);
+        checkpoint is None when resuming is refused because the input or
+        the settings changed.
+        """
+        ckpt = cls(os.path.join(output_dir, CHECKPOINT_NAME), input_hash, settings)
+        if resume and os.path.exists(ckpt.path):
+            header = ckpt._load()
+            if header.get("input_hash") != input_hash:
+                return None, "Error: Refusing to resume, the input changed since the checkpoint was written."
+            if header.get("settings") != settings:
+                return None, f"Error: Refusing to resume, checkpoint was written with different settings: {header.get('settings')}."
+            ckpt._file = open(ckpt.path, "a", encoding="utf-8")
+            if not ckpt._complete:
+                ckpt._file.write("\n")
+            return ckpt, f"Resuming: {len(ckpt.media)} media entries and {len(ckpt.chunks)} parts already done."
+
+        ckpt._file = open(ckpt.path, "w", encoding="utf-8")
+        ckpt._write({"input_hash": input_hash, "settings": settings})
+        msg = "No checkpoint found, starting fresh." if resume else "Checkpoint started."
+        return ckpt, msg
+
+    def _load(self):
+        header = {}
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line_no, line in enumerate(f):
+                self._complete = line.endswith("\n")
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Torn last line from a killed process
+                    continue
+                if line_no == 0:
+                    header = entry
+                elif "media" in entry:
+                    self.media.add(entry["media"])
+                elif "chunk" in entry:
+                    self.chunks.add(entry["chunk"])
+        return header
+
+    def _write(self, entry):
+        self._file.write(json.dumps(entry) + "\n")
+        self._file.flush()
+
+    def mark_media(self, key):
+        self.media.add(key)
+        self._write({"media": key})
+
+    def mark_chunk(self, idx):
+        self.chunks.add(idx)
+        self._write({"chunk": idx})
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def finish(self):
+        """Closes and removes the journal after a completed conversion."""
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
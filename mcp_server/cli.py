@@ -0,0 +1,73 @@
+import argparse
+import sys
+from .anki_logic import convert_deck
+from .shards import merge_shards, parse_shard
+from .sinks import ARCHIVE_FORMATS
+
+def _shard_spec(value):
+    try:
+        return parse_shard(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m mcp_server.cli",
+                                     description="Converts extracted Anki decks to Markdown.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_convert = sub.add_parser("convert", help="Convert an extracted .apkg directory.")
+    p_convert.add_argument("input_dir", help="Directory containing the extracted Anki files.")
+    p_convert.add_argument("output_dir", help="Where the Markdown files are written.")
+    p_convert.add_argument("--chunk-size", type=int, default=50, help="Cards per Markdown file (default: 50).")
+    p_convert.add_argument("--resume", action="store_true",
+                           help="Continue an interrupted conversion from its checkpoint.")
+    p_convert.add_argument("--archive", choices=ARCHIVE_FORMATS,
+                           help="Stream all output into a single Anki_Export.zip/.tar in output_dir.")
+    p_convert.add_argument("--review-stats", action="store_true",
+                           help="Show review count, lapses, ease and last review for each question.")
+    p_convert.add_argument("--shard", type=_shard_spec, metavar="I/N",
+                           help="Convert only shard I of N (0 <= I < N); combine the outputs with 'merge'.")
+
+    p_merge = sub.add_parser("merge", help="Combine the outputs of a sharded conversion.")
+    p_merge.add_argument("output_dir", help="Where the merged Markdown files are written.")
+    p_merge.add_argument("shard_dirs", nargs="+", help="Output directories of all shards.")
+
+    p_watch = sub.add_parser("watch", help="Convert .apkg files as they are dropped into a directory.")
+    p_watch.add_argument("watch_dir", help="Directory receiving .apkg files.")
+    p_watch.add_argument("output_root", help="Each deck is written to output_root/<deck>_extracted.")
+    p_watch.add_argument("--workers", type=int, default=2, help="Warm worker processes (default: 2).")
+    p_watch.add_argument("--interval", type=float, default=2.0, help="Seconds between checks (default: 2).")
+    p_watch.add_argument("--settle", type=float, default=5.0,
+                         help="Seconds a file must stay unchanged before it is converted (default: 5).")
+    p_watch.add_argument("--once", action="store_true", help="Convert the files present now, then exit.")
+    p_watch.add_argument("--poll", action="store_true", help="Poll even if inotify is available.")
+    p_watch.add_argument("--chunk-size", type=int, default=50, help="Cards per Markdown file (default: 50).")
+    p_watch.add_argument("--archive", choices=ARCHIVE_FORMATS,
+                         help="Write each deck as a single Anki_Export.zip/.tar.")
+    p_watch.add_argument("--review-stats", action="store_true",
+                         help="Show review count, lapses, ease and last review for each question.")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "convert":
+        results, ok = convert_deck(args.input_dir, args.output_dir,
+                                   chunk_size=args.chunk_size, resume=args.resume,
+                                   archive=args.archive, review_stats=args.review_stats,
+                                   shard=args.shard)
+        print("\n".join(results))
+        return 0 if ok else 1
+
+    if args.command == "merge":
+        results, ok = merge_shards(args.shard_dirs, args.output_dir)
+        print("\n".join(results))
+        return 0 if ok else 1
+
+    if args.command == "watch":
+        from .watch import watch
+        failures = watch(args.watch_dir, args.output_root, workers=args.workers, interval=args.interval,
+                         settle=args.settle, once=args.once, use_inotify=not args.poll,
+                         chunk_size=args.chunk_size, archive=args.archive, review_stats=args.review_stats)
+        return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,159 @@
+import os
+import sqlite3
+import zstandard
+
+# Header signatures of the members found inside an .apkg
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+SQLITE_MAGIC = b'SQLite format 3\x00'
+
+ZSTD = "zstd"
+JSON = "json"
+PROTOBUF = "protobuf"
+SQLITE = "sqlite"
+UNKNOWN = "unknown"
+
+# Enough bytes to recognise every format above
+HEADER_SIZE = 32
+
+# Collection members, newest first. Recent exports still ship a legacy
+# collection.anki2 that only contains an "update Anki" stub note.
+COLLECTION_NAMES = ("collection.anki21b", "collection.anki21", "collection.anki2")
+
+# Where a compressed collection is decompressed to. The .src file records
+# which member (name, size, mtime) the extracted copy was made from.
+EXTRACTED_NAME = "collection.anki2_extracted"
+EXTRACTED_SOURCE_NAME = EXTRACTED_NAME + ".src"
+# Files open_collection creates next to the members
+EXTRACTED_FILES = (EXTRACTED_NAME, EXTRACTED_NAME + ".tmp", EXTRACTED_SOURCE_NAME)
+
+def sniff_bytes(head):
+    """Classifies a member from its first few bytes."""
+    if head.startswith(ZSTD_MAGIC):
+        return ZSTD
+    if head.startswith(SQLITE_MAGIC):
+        return SQLITE
+    stripped = head.lstrip(b' \t\r\n\xef\xbb\xbf')
+    if stripped[:1] in (b'{', b'['):
+        return JSON
+    # MediaEntries protobuf: field 1, wire type 2 (length-delimited)
+    if head[:1] == b'\x0a':
+        return PROTOBUF
+    return UNKNOWN
+
+def read_header(path, size=HEADER_SIZE):
+    """Reads the first bytes of a file."""
+    with open(path, "rb") as f:
+        return f.read(size)
+
+def read_zstd_header(path, size=HEADER_SIZE):
+    """Decompresses just enough of a zstd file to classify its payload."""
+    with open(path, "rb") as f:
+        with zstandard.ZstdDecompressor().stream_reader(f) as reader:
+            return reader.read(size)
+
+def zstd_frame_complete(path):
+    """True if the zstd file holds at least one complete frame.
+
+    A truncated file decompresses to nothing without raising, which is
+    otherwise indistinguishable from an empty payload.
+    """
+    dobj = zstandard.ZstdDecompressor().decompressobj()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            dobj.decompress(block)
+            if dobj.eof:
+                return True
+    return False
+
+def sniff(path):
+    """Returns (container, payload) formats of a file.
+
+    container is ZSTD when the file is compressed, payload is the format of
+    the (decompressed) content.
+    """
+    head = read_header(path)
+    fmt = sniff_bytes(head)
+    if fmt != ZSTD:
+        return None, fmt
+    head = read_zstd_header(path)
+    if not head:
+        # An empty MediaEntries message compresses to a complete but empty
+        # frame; a truncated file is unusable.
+        return ZSTD, PROTOBUF if zstd_frame_complete(path) else UNKNOWN
+    return ZSTD, sniff_bytes(head)
+
+def read_member(path, container):
+    """Reads a whole member, decompressing it when needed."""
+    with open(path, "rb") as f:
+        if container == ZSTD:
+            with zstandard.ZstdDecompressor().stream_reader(f) as reader:
+                return reader.read()
+        return f.read()
+
+def schema_version(db_path):
+    """Returns the Anki schema version (col.ver) of an SQLite collection."""
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        row = conn.execute("SELECT ver FROM col").fetchone()
+        return row[0] if row else None
+    finally:
+        conn.close()
+
+def find_collection(base_dir):
+    """Finds the newest collection member in base_dir.
+
+    Returns (path, container) or (None, None). Members whose payload is not
+    SQLite are skipped.
+    """
+    for name in COLLECTION_NAMES:
+        path = os.path.join(base_dir, name)
+        if not os.path.exists(path):
+            continue
+        container, payload = sniff(path)
+        if payload == SQLITE:
+            return path, container
+    return None, None
+
+def _extracted_from(db_path, source_path, source):
+    """True if db_path exists and was decompressed from source."""
+    if not os.path.exists(db_path):
+        return False
+    try:
+        with open(source_path, "r", encoding="utf-8") as f:
+            return f.read() == source
+    except OSError:
+        return False
+
+def open_collection(base_dir):
+    """Locates the collection and decompresses it if needed.
+
+    Returns (db_path, schema, message). db_path is None if nothing usable
+    was found.
+    """
+    src, container = find_collection(base_dir)
+    if src is None:
+        return None, None, "Error: No collection.anki2, collection.anki21 or collection.anki21b found."
+
+    db_path = src
+    msg = f"Using {os.path.basename(src)}."
+    if container == ZSTD:
+        db_path = os.path.join(base_dir, EXTRACTED_NAME)
+        source_path = os.path.join(base_dir, EXTRACTED_SOURCE_NAME)
+        st = os.stat(src)
+        source = f"{os.path.basename(src)}\0{st.st_size}\0{st.st_mtime_ns}"
+        if not _extracted_from(db_path, source_path, source):
+            tmp_path = db_path + ".tmp"
+            with open(src, "rb") as f_in, open(tmp_path, "wb") as f_out:
+                zstandard.ZstdDecompressor().copy_stream(f_in, f_out)
+            os.replace(tmp_path, db_path)
+            with open(source_path, "w", encoding="utf-8") as f:
+                f.write(source)
+            msg = f"Decompressed {os.path.basename(src)}."
+
+    try:
+        schema = schema_version(db_path)
+    except sqlite3.Error:
+        schema = None
+    if schema is not None:
+        msg += f" Schema v{schema}."
+    return db_path, schema, msg
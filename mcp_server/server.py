@@ -1,11 +1,8 @@
 import asyncio
-import os
-import shutil
-import zipfile
 from mcp.server import Server
 from mcp.types import Tool, TextContent, ImageContent, EmbeddedResource
 from mcp.server.stdio import stdio_server
-from .anki_logic import convert_deck
+from .anki_logic import convert_apkg
 
 app = Server("anki-converter")
 
@@ -29,6 +26,19 @@ async def list_tools() -> list[Tool]:
                     "chunk_size": {
                         "type": "integer",
                         "description": "Number of cards per Markdown file. Default: 50"
+                    },
+                    "resume": {
+                        "type": "boolean",
+                        "description": "Continue an interrupted conversion into the same output_dir. Default: false"
+                    },
+                    "archive": {
+                        "type": "string",
+                        "enum": ["zip", "tar"],
+                        "description": "Optional. Stream all Markdown parts and images into a single Anki_Export.zip/.tar in output_dir."
+                    },
+                    "review_stats": {
+                        "type": "boolean",
+                        "description": "Show review count, lapses, ease and last review for each question. Default: false"
                     }
                 },
                 "required": ["apkg_path"]
@@ -42,36 +52,15 @@ async def call_tool(name: str, arguments: dict) -> list[TextContent | ImageConte
         apkg_path = arguments["apkg_path"]
         output_dir = arguments.get("output_dir")
         chunk_size = arguments.get("chunk_size", 50)
+        resume = arguments.get("resume", False)
+        archive = arguments.get("archive")
+        review_stats = arguments.get("review_stats", False)
 
-        if not os.path.exists(apkg_path):
-            return [TextContent(type="text", text=f"Error: File not found at {apkg_path}")]
-
-        # Determine output directory
+        results, output_dir, _ = convert_apkg(apkg_path, output_dir, chunk_size=chunk_size, resume=resume,
+                                              archive=archive, review_stats=review_stats)
         if output_dir is None:
-            base_name = os.path.splitext(os.path.basename(apkg_path))[0]
-            output_dir = os.path.join(os.path.dirname(apkg_path), f"{base_name}_extracted")
-        
-        os.makedirs(output_dir, exist_ok=True)
-        
-        # Extract .apkg (it is a zip)
-        extract_temp = os.path.join(output_dir, "temp_extract")
-        os.makedirs(extract_temp, exist_ok=True)
-        
-        try:
-            with zipfile.ZipFile(apkg_path, 'r') as zip_ref:
-                zip_ref.extractall(extract_temp)
-        except zipfile.BadZipFile:
-            return [TextContent(type="text", text="Error: Invalid .apkg file (not a valid zip).")]
+            return [TextContent(type="text", text="\n".join(results))]
 
-        # Run conversion
-        results = convert_deck(extract_temp, output_dir, chunk_size=chunk_size)
-        
-        # Cleanup temp
-        try:
-            shutil.rmtree(extract_temp)
-        except:
-            pass
-        
         result_text = "\n".join(results) + f"\n\nOutput saved to: {output_dir}"
         return [TextContent(type="text", text=result_text)]
 
@@ -0,0 +1,140 @@
+import json
+import os
+import re
+import shutil
+import zlib
+
+MANIFEST_NAME = ".anki_shard.json"
+
+PART_RE = re.compile(r'Anki_Part_\d+\.md')
+
+def parse_shard(spec):
+    """Parses "i/N" (0 <= i < N) into (i, N)."""
+    match = re.fullmatch(r'\s*(\d+)\s*/\s*(\d+)\s*', spec)
+    if not match:
+        raise ValueError(f"Invalid shard '{spec}', expected i/N.")
+    index, count = int(match.group(1)), int(match.group(2))
+    if count < 1 or index >= count:
+        raise ValueError(f"Invalid shard '{spec}', need 0 <= i < N.")
+    return index, count
+
+def owns_part(part, shard):
+    """Parts are dealt round-robin, so shard i renders parts i+1, i+1+N, ...
+
+    Notes are read in id order, which keeps the part a note lands in (and
+    its position inside the part) identical to a single-node run.
+    """
+    index, count = shard
+    return (part - 1) % count == index
+
+def owns_media(clean_name, own_refs, all_refs, shard):
+    """Media goes to every shard that references it; unreferenced media to
+    exactly one shard, chosen from a stable hash of its name."""
+    if clean_name in own_refs:
+        return True
+    if clean_name in all_refs:
+        return False
+    index, count = shard
+    return zlib.crc32(clean_name.encode("utf-8")) % count == index
+
+def write_manifest(sink, shard, input_hash, settings, parts, total_parts):
+    manifest = {
+        "shard": list(shard),
+        "input_hash": input_hash,
+        # Everything but the shard itself must match across shards
+        "settings": {k: v for k, v in settings.items() if k != "shard"},
+        "parts": parts,
+        "total_parts": total_parts,
+    }
+    sink.write(MANIFEST_NAME, json.dumps(manifest, indent=1).encode("utf-8"))
+
+def read_manifest(shard_dir):
+    with open(os.path.join(shard_dir, MANIFEST_NAME), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def _place(src, dst):
+    """Hard-links src to dst where possible (same filesystem), else copies."""
+    if os.path.exists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+def merge_shards(shard_dirs, output_dir):
+    """Combines the outputs of all shards of one run in output_dir.
+
+    The result has the same part numbering and Anki_Images/ layout as a
+    single-node run. Shards are validated first, then their files are
+    linked or copied; the shard outputs are only removed once every shard
+    has been merged, so a failed merge can simply be run again.
+
+    Returns (log, ok).
+    """
+    if not shard_dirs:
+        return ["Error: No shard directories given."], False
+    manifests = []
+    for shard_dir in shard_dirs:
+        try:
+            manifests.append(read_manifest(shard_dir))
+        except (OSError, ValueError):
+            return [f"Error: {shard_dir} is not a completed shard output (no {MANIFEST_NAME})."], False
+
+    first = manifests[0]
+    count = first["shard"][1]
+    for shard_dir, manifest in zip(shard_dirs, manifests):
+        for key, label in (("input_hash", "input"), ("settings", "settings"), ("total_parts", "part count")):
+            if manifest[key] != first[key]:
+                return [f"Error: {shard_dir} and {shard_dirs[0]} differ in {label}."], False
+        if manifest["shard"][1] != count:
+            return [f"Error: {shard_dir} belongs to a run with {manifest['shard'][1]} shards, not {count}."], False
+
+    indices = sorted(m["shard"][0] for m in manifests)
+    if indices != list(range(count)):
+        missing = sorted(set(range(count)) - set(indices))
+        return [f"Error: Expected shards 0..{count - 1} exactly once; missing {missing}, got {indices}."], False
+    parts = sorted(p for m in manifests for p in m["parts"])
+    if parts != list(range(1, first["total_parts"] + 1)):
+        return ["Error: Shard parts do not add up to a complete run."], False
+
+    # Parts left over from an earlier, larger run would silently survive
+    if os.path.isdir(output_dir) and any(PART_RE.fullmatch(name) for name in os.listdir(output_dir)):
+        return [f"Error: {output_dir} already contains Anki_Part_*.md files."], False
+
+    images_dir = os.path.join(output_dir, "Anki_Images")
+    os.makedirs(images_dir, exist_ok=True)
+    written = []
+    images = set()
+    try:
+        for shard_dir, manifest in zip(shard_dirs, manifests):
+            for part in manifest["parts"]:
+                filename = f"Anki_Part_{part}.md"
+                dst = os.path.join(output_dir, filename)
+                _place(os.path.join(shard_dir, filename), dst)
+                written.append(dst)
+            shard_images = os.path.join(shard_dir, "Anki_Images")
+            for name in sorted(os.listdir(shard_images)):
+                # Shared media is identical in every shard that references it
+                if name in images:
+                    continue
+                dst = os.path.join(images_dir, name)
+                _place(os.path.join(shard_images, name), dst)
+                written.append(dst)
+                images.add(name)
+    except OSError as e:
+        for path in written:
+            if os.path.exists(path):
+                os.remove(path)
+        return [f"Error: Merge failed, shard outputs left untouched: {e}"], False
+
+    # Every shard is merged; only now remove the shard outputs
+    for shard_dir, manifest in zip(shard_dirs, manifests):
+        for part in manifest["parts"]:
+            os.remove(os.path.join(shard_dir, f"Anki_Part_{part}.md"))
+        shard_images = os.path.join(shard_dir, "Anki_Images")
+        for name in os.listdir(shard_images):
+            os.remove(os.path.join(shard_images, name))
+        os.rmdir(shard_images)
+        os.remove(os.path.join(shard_dir, MANIFEST_NAME))
+
+    return [f"Merged {count} shards: {len(parts)} MD files, {len(images)} media files."], True
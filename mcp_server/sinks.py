@@ -0,0 +1,204 @@
+import io
+import os
+import shutil
+import tarfile
+import time
+import zipfile
+
+ARCHIVE_FORMATS = ("zip", "tar")
+ARCHIVE_BASENAME = "Anki_Export"
+
+# Already compressed; deflating them again only costs time
+STORED_EXTENSIONS = (".jpg", ".jpeg", ".png", ".gif", ".webp", ".avif", ".heic",
+                     ".mp3", ".m4a", ".ogg", ".opus", ".mp4", ".webm", ".zip", ".gz")
+
+# Block size for streamed copies
+COPY_BUFSIZE = 1 << 20
+
+class _Sink:
+    """Common write rules for all output modes.
+
+    The first write of a name wins; repeated writes of the same name within
+    a run are ignored, so directory and archive output hold the same files
+    when two media entries sanitize to one name.
+    """
+
+    def __init__(self):
+        self._names = set()
+
+    def write(self, name, data):
+        if name in self._names:
+            return
+        self._write(name, data)
+        self._names.add(name)
+
+    def write_stream(self, name, open_stream, size=None):
+        """Copies a stream into name without holding it in memory.
+
+        open_stream() returns a new readable (a context manager) on every
+        call; size is its length in bytes, or None if unknown. A stream that
+        fails while being read leaves no trace, so the caller may retry the
+        same name from another source.
+        """
+        if name in self._names:
+            return
+        self._write_stream(name, open_stream, size)
+        self._names.add(name)
+
+class DirectorySink(_Sink):
+    """Writes outputs as plain files below output_dir."""
+
+    def __init__(self, output_dir):
+        super().__init__()
+        self.output_dir = output_dir
+        self.location = output_dir
+        os.makedirs(os.path.join(output_dir, "Anki_Images"), exist_ok=True)
+
+    def path(self, name):
+        return os.path.join(self.output_dir, *name.split("/"))
+
+    def exists(self, name):
+        return name in self._names or os.path.exists(self.path(name))
+
+    def _write(self, name, data):
+        """Writes data atomically so a killed run never leaves half a file."""
+        path = self.path(name)
+        temp_path = path + ".tmp"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+    def _write_stream(self, name, open_stream, size):
+        path = self.path(name)
+        temp_path = path + ".tmp"
+        try:
+            with open_stream() as src, open(temp_path, "wb") as dst:
+                shutil.copyfileobj(src, dst, COPY_BUFSIZE)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        os.replace(temp_path, path)
+
+    def close(self):
+        pass
+
+    def abort(self):
+        pass
+
+class _ArchiveSink(_Sink):
+    """Streams outputs into a single archive in output_dir.
+
+    The archive is built under a temporary name and only renamed into place
+    by close(), so readers never see a truncated bundle. Entries use the
+    same layout as a directory export, so relative links still resolve.
+    """
+
+    extension = None
+
+    def __init__(self, output_dir):
+        super().__init__()
+        os.makedirs(output_dir, exist_ok=True)
+        self.location = os.path.join(output_dir, ARCHIVE_BASENAME + self.extension)
+        self._temp = self.location + ".tmp"
+        self._open(self._temp)
+
+    def exists(self, name):
+        return name in self._names
+
+    def close(self):
+        self._close()
+        os.replace(self._temp, self.location)
+
+    def abort(self):
+        self._close()
+        if os.path.exists(self._temp):
+            os.remove(self._temp)
+
+class ZipSink(_ArchiveSink):
+    extension = ".zip"
+
+    def _open(self, path):
+        self._zip = zipfile.ZipFile(path, "w", allowZip64=True)
+
+    def _info(self, name):
+        info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+        if name.lower().endswith(STORED_EXTENSIONS):
+            info.compress_type = zipfile.ZIP_STORED
+        else:
+            info.compress_type = zipfile.ZIP_DEFLATED
+        return info
+
+    def _write(self, name, data):
+        self._zip.writestr(self._info(name), data)
+
+    def _write_stream(self, name, open_stream, size):
+        info = self._info(name)
+        # zipfile needs the size up front only to choose ZIP64 headers;
+        # streams of unknown size (zstd media) always get them and are
+        # decoded in a single pass.
+        if size is not None:
+            info.file_size = size
+        try:
+            with open_stream() as src, self._zip.open(info, "w", force_zip64=size is None) as dst:
+                shutil.copyfileobj(src, dst, COPY_BUFSIZE)
+        except BaseException:
+            self._drop(info)
+            raise
+
+    def _drop(self, info):
+        """Cuts a partly written entry off the end of the archive.
+
+        zipfile finalises an entry even when the copy into it fails; a
+        corrupt stream must leave no trace so the caller can retry the name.
+        """
+        zf = self._zip
+        if not zf.filelist or zf.filelist[-1] is not info:
+            return
+        zf.filelist.pop()
+        del zf.NameToInfo[info.filename]
+        zf.start_dir = info.header_offset
+        zf.fp.seek(info.header_offset)
+        zf.fp.truncate()
+
+    def _close(self):
+        self._zip.close()
+
+class TarSink(_ArchiveSink):
+    extension = ".tar"
+
+    def _open(self, path):
+        self._tar = tarfile.open(path, "w")
+
+    def _info(self, name, size):
+        info = tarfile.TarInfo(name)
+        info.size = size
+        info.mtime = int(time.time())
+        return info
+
+    def _write(self, name, data):
+        self._tar.addfile(self._info(name, len(data)), io.BytesIO(data))
+
+    def _write_stream(self, name, open_stream, size):
+        if size is None:
+            # Tar headers need the size, so measure first; a stream that
+            # fails (e.g. corrupt zstd) then fails before the archive is touched.
+            size = 0
+            with open_stream() as src:
+                for block in iter(lambda: src.read(COPY_BUFSIZE), b""):
+                    size += len(block)
+        with open_stream() as src:
+            self._tar.addfile(self._info(name, size), src)
+
+    def _close(self):
+        self._tar.close()
+
+def open_sink(output_dir, archive=None):
+    """Returns the sink for the requested output mode (None, "zip" or "tar")."""
+    if archive is None:
+        return DirectorySink(output_dir)
+    if archive == "zip":
+        return ZipSink(output_dir)
+    if archive == "tar":
+        return TarSink(output_dir)
+    raise ValueError(f"Unknown archive format: {archive}")
@@ -0,0 +1,229 @@
+import json
+import os
+import shutil
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from .anki_logic import convert_apkg
+from .checkpoint import hash_file
+
+try:
+    import inotify_simple
+except ImportError:
+    inotify_simple = None
+
+STATE_NAME = ".anki_watch_state.json"
+
+def _warm_worker():
+    """Pays the heavy imports once per worker instead of once per deck."""
+    import zstandard  # noqa: F401
+    from PIL import Image
+    Image.init()
+
+def _replace_dir(new_dir, output_dir):
+    """Moves new_dir to output_dir, replacing what was there."""
+    old_dir = output_dir + ".old"
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.exists(output_dir):
+        os.rename(output_dir, old_dir)
+    os.rename(new_dir, output_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+def _convert_job(apkg_path, output_dir, known_hash, options):
+    """Runs in a worker. Returns (digest, log, ok); log is None if unchanged.
+
+    The deck is converted into output_dir.new and swapped in on success, so
+    parts and images an updated deck no longer has do not survive, and a
+    failed update leaves the previous output in place.
+    """
+    digest = hash_file(apkg_path)
+    if digest == known_hash:
+        return digest, None, True
+    staging = output_dir + ".new"
+    resume = options.get("resume", False)
+    if not resume:
+        shutil.rmtree(staging, ignore_errors=True)
+    results, _, ok = convert_apkg(apkg_path, staging, **options)
+    if ok:
+        _replace_dir(staging, output_dir)
+    elif not resume:
+        shutil.rmtree(staging, ignore_errors=True)
+    return digest, results, ok
+
+def load_state(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_state(path, state):
+    temp_path = path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=1, sort_keys=True)
+    os.replace(temp_path, path)
+
+class _Poller:
+    """Reports every .apkg in the directory on each tick."""
+
+    def __init__(self, watch_dir):
+        self.watch_dir = watch_dir
+
+    def names(self, timeout):
+        time.sleep(timeout)
+        return [entry.name for entry in os.scandir(self.watch_dir)
+                if entry.is_file() and entry.name.lower().endswith(".apkg")]
+
+    def close(self):
+        pass
+
+class _InotifyWatcher:
+    """Reports .apkg files touched since the last tick."""
+
+    def __init__(self, watch_dir):
+        flags = inotify_simple.flags
+        self._inotify = inotify_simple.INotify()
+        self._inotify.add_watch(watch_dir, flags.CLOSE_WRITE | flags.MOVED_TO | flags.MODIFY | flags.CREATE)
+
+    def names(self, timeout):
+        events = self._inotify.read(timeout=int(timeout * 1000))
+        return [e.name for e in events if e.name.lower().endswith(".apkg")]
+
+    def close(self):
+        self._inotify.close()
+
+def watch(watch_dir, output_root, workers=2, interval=2.0, settle=5.0, once=False,
+          use_inotify=True, log=print, **options):
+    """Converts .apkg files dropped into watch_dir, until interrupted.
+
+    A file is converted once its size and mtime have not changed for
+    settle seconds. Each deck goes to output_root/<deck>_extracted. The
+    SHA-256, size and mtime of every converted deck, and the size and mtime
+    of every deck that failed, are kept in output_root, so unchanged decks
+    are skipped, also across restarts. If a worker dies, the pool is
+    restarted and the decks that were in flight are retried one at a time;
+    only a deck that takes down a worker on its own is recorded as failed.
+    With once=True the files present at start are processed and the
+    function returns. options are passed on to convert_deck.
+
+    Returns the number of decks that failed during this call.
+    """
+    os.makedirs(output_root, exist_ok=True)
+    state_path = os.path.join(output_root, STATE_NAME)
+    state = load_state(state_path)
+    failures = 0
+
+    if once:
+        watcher = None
+    elif use_inotify and inotify_simple is not None:
+        watcher = _InotifyWatcher(watch_dir)
+        log(f"Watching {watch_dir} (inotify).")
+    else:
+        watcher = _Poller(watch_dir)
+        log(f"Watching {watch_dir} (polling every {interval}s).")
+
+    pending = dict.fromkeys(_Poller(watch_dir).names(0))  # name -> (size, mtime_ns, since)
+    running = {}  # future -> (name, (size, mtime_ns))
+    suspects = set()  # in flight when a worker died; retried in isolation
+    broken = False
+
+    def may_submit(name):
+        if broken or any(n in suspects for n, _ in running.values()):
+            return False
+        if name in suspects:
+            return not running
+        # Let the pool drain so waiting suspects get their solo run
+        return not any(n in suspects for n in pending)
+
+    def finish(future):
+        nonlocal failures, broken
+        name, sig = running.pop(future)
+        try:
+            digest, results, ok = future.result()
+        except BrokenProcessPool:
+            # A worker died (OOM kill, segfault) and took every deck in
+            # flight with it. Suspects run alone, so one is to blame; any
+            # other deck is retried on its own first.
+            broken = True
+            if name not in suspects:
+                log(f"{name}: worker died, retrying on its own.")
+                suspects.add(name)
+                pending[name] = None
+                return
+            digest, results, ok = None, ["failed: worker died while converting it."], False
+        except Exception as e:
+            digest, results, ok = None, [f"failed: {e}"], False
+        if results is None:
+            log(f"{name}: unchanged, skipped.")
+        else:
+            log(f"{name}: " + " ".join(results))
+        suspects.discard(name)
+        if ok:
+            state[name] = {"sha256": digest, "size": sig[0], "mtime_ns": sig[1]}
+        else:
+            # Not retried until the file changes, also after a restart
+            failures += 1
+            state[name] = {"failed": True, "size": sig[0], "mtime_ns": sig[1]}
+        save_state(state_path, state)
+
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=_warm_worker)
+    try:
+        while True:
+            for future in [f for f in running if f.done()]:
+                finish(future)
+            if broken and not running:
+                pool.shutdown(wait=True)
+                pool = ProcessPoolExecutor(max_workers=workers, initializer=_warm_worker)
+                broken = False
+                log("Worker pool restarted.")
+
+            now = time.monotonic()
+            busy = {name for name, _ in running.values()}
+            for name in list(pending):
+                if name in busy:
+                    # Changed again while converting; retry once it is done
+                    continue
+                try:
+                    st = os.stat(os.path.join(watch_dir, name))
+                except FileNotFoundError:
+                    del pending[name]
+                    continue
+                sig = (st.st_size, st.st_mtime_ns)
+                record = state.get(name)
+                if record and (record["size"], record["mtime_ns"]) == sig:
+                    del pending[name]
+                    continue
+                seen = pending[name]
+                if seen is None or seen[:2] != sig:
+                    # Still being written; restart the debounce window
+                    pending[name] = sig + (now,)
+                elif now - seen[2] >= settle and may_submit(name):
+                    output_dir = os.path.join(output_root, os.path.splitext(name)[0] + "_extracted")
+                    known_hash = record.get("sha256") if record else None
+                    try:
+                        future = pool.submit(_convert_job, os.path.join(watch_dir, name), output_dir, known_hash, options)
+                    except BrokenProcessPool:
+                        # Noticed before the in-flight futures were; submit after the restart
+                        broken = True
+                        continue
+                    del pending[name]
+                    running[future] = (name, sig)
+
+            if watcher is None:
+                if not pending and not running:
+                    break
+                if running:
+                    wait(running, timeout=min(interval, settle), return_when=FIRST_COMPLETED)
+                else:
+                    time.sleep(min(interval, settle))
+                continue
+            for name in watcher.names(interval):
+                pending.setdefault(name, None)
+    except KeyboardInterrupt:
+        log("Stopping.")
+    finally:
+        if watcher is not None:
+            watcher.close()
+        pool.shutdown(wait=True, cancel_futures=True)
+    return failures
@@ -0,0 +1,212 @@
+"""Sharded conversion + merge must reproduce a single-node run byte for byte.
+
+Run from the repository root with either of:
+
+    python -m pytest tests
+    python -m unittest discover tests
+"""
+import base64
+import io
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import unittest
+
+import zstandard
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mcp_server.anki_logic import convert_deck
+from mcp_server.shards import merge_shards
+
+NOTES = 61
+CHUNK_SIZE = 7
+MEDIA = 12
+SHARED = ("img 0.png", "img 1.png")  # referenced from notes all over the deck
+ORPHANS = ("img 10.png", "img 11.png")  # in the media map, used by no note
+
+def png(seed):
+    buf = io.BytesIO()
+    Image.new("RGB", (4 + seed, 4), (seed * 20 % 256, 40, 90)).save(buf, "PNG")
+    return buf.getvalue()
+
+def varint(n):
+    out = b""
+    while True:
+        b = n & 0x7F
+        n >>= 7
+        if n:
+            out += bytes([b | 0x80])
+        else:
+            return out + bytes([b])
+
+def media_protobuf(names):
+    data = b""
+    for name in names:
+        raw = name.encode("utf-8")
+        entry = b"\x0a" + varint(len(raw)) + raw + b"\x10" + varint(100)
+        data += b"\x0a" + varint(len(entry)) + entry
+    return data
+
+def build_collection(path, schema):
+    inline = base64.b64encode(png(99)).decode("ascii")
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+    CREATE TABLE col (id integer primary key, ver integer not null);
+    CREATE TABLE notes (id integer primary key, flds text not null);
+    CREATE TABLE cards (id integer primary key, nid integer not null,
+                        factor integer not null, lapses integer not null);
+    CREATE TABLE revlog (id integer primary key, cid integer not null, ease integer not null,
+                         factor integer not null, type integer not null);
+    CREATE INDEX ix_revlog_cid on revlog (cid);
+    """)
+    conn.execute("INSERT INTO col VALUES (1, ?)", (schema,))
+    for i in range(NOTES):
+        # Ids are inserted out of order so shards must sort by note id
+        nid = 1_600_000_000_000 + (i * 37) % NOTES
+        front = f"Front {nid}"
+        if i % 5 == 0:
+            front += f' <img src="{SHARED[i % 2]}">'
+        if i % 9 == 3:
+            front += f' <img src="img {2 + i % 8}.png">'
+        back = f"Back {nid}"
+        if i % 13 == 4:
+            back += f' <img src="data:image/png;base64,{inline}">'
+        conn.execute("INSERT INTO notes VALUES (?, ?)", (nid, f"{front}\x1f{back}"))
+        conn.execute("INSERT INTO cards VALUES (?, ?, ?, ?)", (nid + 1, nid, 2500, i % 3))
+        for r in range(i % 4):
+            conn.execute("INSERT INTO revlog VALUES (?, ?, ?, ?, ?)",
+                         (1_650_000_000_000 + i * 1000 + r, nid + 1, 1 + r % 4, 2500, 1))
+    conn.commit()
+    conn.close()
+
+def build_v11_deck(deck_dir):
+    """Plain SQLite collection.anki2 with a JSON media map and raw files."""
+    os.makedirs(deck_dir)
+    build_collection(os.path.join(deck_dir, "collection.anki2"), 11)
+    names = [f"img {i}.png" for i in range(MEDIA)]
+    with open(os.path.join(deck_dir, "media"), "w", encoding="utf-8") as f:
+        json.dump({str(i): name for i, name in enumerate(names)}, f)
+    for i in range(MEDIA):
+        with open(os.path.join(deck_dir, str(i)), "wb") as f:
+            f.write(png(i))
+
+def build_v18_deck(deck_dir):
+    """zstd collection.anki21b, zstd Protobuf media map, zstd media files."""
+    os.makedirs(deck_dir)
+    cctx = zstandard.ZstdCompressor()
+    db_path = os.path.join(deck_dir, "plain.db")
+    build_collection(db_path, 18)
+    with open(db_path, "rb") as f:
+        data = f.read()
+    os.remove(db_path)
+    with open(os.path.join(deck_dir, "collection.anki21b"), "wb") as f:
+        f.write(cctx.compress(data))
+    # Legacy stub that newer exports still ship
+    stub = sqlite3.connect(os.path.join(deck_dir, "collection.anki2"))
+    stub.executescript("CREATE TABLE col (id integer primary key, ver integer);"
+                       "INSERT INTO col VALUES (1, 11);"
+                       "CREATE TABLE notes (id integer primary key, flds text);"
+                       "INSERT INTO notes VALUES (1, 'Please update Anki');")
+    stub.commit()
+    stub.close()
+    names = [f"img {i}.png" for i in range(MEDIA)]
+    with open(os.path.join(deck_dir, "media"), "wb") as f:
+        f.write(cctx.compress(media_protobuf(names)))
+    for i in range(MEDIA):
+        with open(os.path.join(deck_dir, str(i)), "wb") as f:
+            f.write(cctx.compress(png(i)))
+
+def read_tree(root):
+    """Returns {relative path: bytes} for every file below root."""
+    tree = {}
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            with open(path, "rb") as f:
+                tree[os.path.relpath(path, root)] = f.read()
+    return tree
+
+class ShardEquivalenceTest(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.tmp = self._tmp.name
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def convert(self, deck_dir, output_dir, shard=None):
+        log, ok = convert_deck(deck_dir, output_dir, chunk_size=CHUNK_SIZE, review_stats=True, shard=shard)
+        self.assertTrue(ok, log)
+        return log
+
+    def check_deck(self, deck_dir):
+        single = os.path.join(self.tmp, "single")
+        self.convert(deck_dir, single)
+        expected = read_tree(single)
+
+        # The fixture must exercise every media path the shards split up
+        self.assertEqual(len([p for p in expected if p.endswith(".md")]), -(-NOTES // CHUNK_SIZE))
+        images = {p for p in expected if p.startswith("Anki_Images")}
+        for name in SHARED + ORPHANS:
+            self.assertIn(os.path.join("Anki_Images", name.replace(" ", "_")), images)
+        self.assertTrue(any(os.path.basename(p).startswith("inline_") for p in images))
+
+        for count in (1, 3, 7):
+            with self.subTest(shards=count):
+                shard_dirs = [os.path.join(self.tmp, f"shard_{count}_{i}") for i in range(count)]
+                for i, shard_dir in enumerate(shard_dirs):
+                    self.convert(deck_dir, shard_dir, shard=(i, count))
+                merged = os.path.join(self.tmp, f"merged_{count}")
+                log, ok = merge_shards(shard_dirs, merged)
+                self.assertTrue(ok, log)
+                self.assertEqual(read_tree(merged), expected)
+
+    def test_v11_deck(self):
+        deck_dir = os.path.join(self.tmp, "v11")
+        build_v11_deck(deck_dir)
+        self.check_deck(deck_dir)
+
+    def test_v18_deck(self):
+        deck_dir = os.path.join(self.tmp, "v18")
+        build_v18_deck(deck_dir)
+        self.check_deck(deck_dir)
+
+class MergeValidationTest(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.tmp = self._tmp.name
+        self.deck_dir = os.path.join(self.tmp, "deck")
+        build_v11_deck(self.deck_dir)
+        self.shard_dirs = [os.path.join(self.tmp, f"shard_{i}") for i in range(3)]
+        for i, shard_dir in enumerate(self.shard_dirs):
+            log, ok = convert_deck(self.deck_dir, shard_dir, chunk_size=CHUNK_SIZE, shard=(i, 3))
+            self.assertTrue(ok, log)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_refuses_incomplete_shard_set(self):
+        before = read_tree(self.tmp)
+        log, ok = merge_shards(self.shard_dirs[:2], os.path.join(self.tmp, "merged"))
+        self.assertFalse(ok)
+        self.assertIn("missing [2]", log[0])
+        self.assertEqual(read_tree(self.tmp), before)
+
+    def test_refuses_output_with_leftover_parts(self):
+        merged = os.path.join(self.tmp, "merged")
+        os.makedirs(merged)
+        with open(os.path.join(merged, "Anki_Part_99.md"), "w", encoding="utf-8") as f:
+            f.write("stale")
+        before = {d: read_tree(d) for d in self.shard_dirs}
+        log, ok = merge_shards(self.shard_dirs, merged)
+        self.assertFalse(ok)
+        self.assertEqual({d: read_tree(d) for d in self.shard_dirs}, before)
+
+if __name__ == "__main__":
+    unittest.main()